@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
 import argparse
 import datetime
+import itertools
 import logging
-import re
 import shutil
 import subprocess
 import sys
@@ -19,10 +19,11 @@ intermediate file that must first go through pip-compile before being used in
 a Cachito request.
 """
 
-logging.basicConfig(format="%(levelname)s: %(message)s")
-
 log = logging.getLogger(__name__)
-log.setLevel(logging.INFO)
+
+# Pip download reports each requirement it collects as "Collecting <requirement>",
+# indented if the requirement is collected for a build environment
+COLLECTING_PREFIX = "Collecting "
 
 
 class FindBuilddepsError(Exception):
@@ -30,7 +31,13 @@ class FindBuilddepsError(Exception):
 
 
 def _pip_download(requirements_files, output_file, tmpdir, no_cache):
-    """Run pip download, write output to file."""
+    """
+    Run pip download, find build dependencies in its output as it is produced.
+
+    The output of pip download is only written to output_file if pip download fails.
+
+    :return: set of build dependencies and the return code of pip download
+    """
     cmd = [
         "pip",
         "download",
@@ -40,6 +47,9 @@ def _pip_download(requirements_files, output_file, tmpdir, no_cache):
         ":all:",
         "--use-pep517",
         "--verbose",
+        # The progress bar is pure noise, all we need are the "Collecting" lines
+        "--progress-bar",
+        "off",
     ]
     if no_cache:
         cmd.append("--no-cache-dir")
@@ -47,24 +57,56 @@ def _pip_download(requirements_files, output_file, tmpdir, no_cache):
         cmd.append("-r")
         cmd.append(file)
 
-    with open(output_file, "w") as outfile:
-        subprocess.run(cmd, stdout=outfile, stderr=outfile, check=True)
+    output_lines = []
 
+    def tee(lines):
+        for line in lines:
+            output_lines.append(line)
+            yield line
 
-def _filter_builddeps(pip_download_output_file):
-    """Find builddeps in output of pip download."""
-    # Requirement is a sequence of non-whitespace, non-';' characters
-    # Example: package, package==1.0, package[extra]==1.0
-    requirement_re = r"[^\s;]+"
+    with subprocess.Popen(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    ) as proc:
+        builddeps = _filter_builddeps(tee(proc.stdout))
+
+    if proc.returncode != 0:
+        with open(output_file, "w") as outfile:
+            outfile.writelines(output_lines)
+
+    return builddeps, proc.returncode
+
+
+def _take_requirement(text, delimiters=";"):
+    """Return the leading part of text up to the first whitespace or delimiter."""
+    for i, char in enumerate(text):
+        if char.isspace() or char in delimiters:
+            return text[:i]
+    return text
+
+
+def _parse_builddep(line):
+    """Get the requirement from a pip download output line, if it is a builddep."""
     # Leading whitespace => requirement is a build dependency
     # (because all recursive runtime dependencies were present in input files)
-    builddep_re = re.compile(rf"^\s+Collecting ({requirement_re})")
+    if not line[:1].isspace():
+        return None
+    stripped = line.lstrip()
+    if not stripped.startswith(COLLECTING_PREFIX):
+        return None
+    # Requirement is a sequence of non-whitespace, non-';' characters
+    # Example: package, package==1.0, package[extra]==1.0
+    return _take_requirement(stripped[len(COLLECTING_PREFIX) :]) or None
 
-    with open(pip_download_output_file) as f:
-        matches = (builddep_re.match(line) for line in f)
-        builddeps = set(match.group(1) for match in matches if match)
 
-    return sorted(builddeps)
+def _filter_builddeps(pip_download_output):
+    """Find builddeps in output of pip download (an iterable of lines)."""
+    # Cheap substring test first, most lines of the output are not "Collecting" lines
+    builddeps = (
+        _parse_builddep(line)
+        for line in pip_download_output
+        if COLLECTING_PREFIX in line
+    )
+    return set(builddep for builddep in builddeps if builddep)
 
 
 def find_builddeps(requirements_files, no_cache=False, ignore_errors=False):
@@ -74,16 +116,24 @@ def find_builddeps(requirements_files, no_cache=False, ignore_errors=False):
     :param requirements_files: list of requirements file paths
     :param no_cache: do not use pip cache when downloading packages
     :param ignore_errors: generate partial output even if pip download fails
-    :return: list of build dependencies and bool whether output is partial
+    :return: set of build dependencies and bool whether output is partial
     """
-    tmpdir = tempfile.mkdtemp(prefix=f"{SCRIPT_NAME}-")
-    pip_output_file = Path(tmpdir) / "pip-download-output.txt"
     is_partial = False
 
-    try:
+    with tempfile.TemporaryDirectory(prefix=f"{SCRIPT_NAME}-") as tmpdir:
+        pip_output_file = Path(tmpdir) / "pip-download-output.txt"
+
         log.info("Running pip download, this may take a while")
-        _pip_download(requirements_files, pip_output_file, tmpdir, no_cache)
-    except subprocess.CalledProcessError:
+        builddeps, returncode = _pip_download(
+            requirements_files, pip_output_file, tmpdir, no_cache
+        )
+
+        if returncode != 0:
+            # tmpdir is about to be removed, keep the output of pip download around
+            output_dir = tempfile.mkdtemp(prefix=f"{SCRIPT_NAME}-")
+            pip_output_file = shutil.copy(pip_output_file, output_dir)
+
+    if returncode != 0:
         msg = f"Pip download failed, see {pip_output_file} for more info"
         if ignore_errors:
             log.error(msg)
@@ -92,13 +142,6 @@ def find_builddeps(requirements_files, no_cache=False, ignore_errors=False):
         else:
             raise FindBuilddepsError(msg)
 
-    log.info("Looking for build dependencies in the output of pip download")
-    builddeps = _filter_builddeps(pip_output_file)
-
-    # Remove tmpdir only if pip download was successful
-    if not is_partial:
-        shutil.rmtree(tmpdir)
-
     return builddeps, is_partial
 
 
@@ -108,21 +151,20 @@ def generate_file_content(builddeps, is_partial):
 
     :param builddeps: list of build dependencies to include in file
     :param is_partial: indicates that list of build dependencies may be partial
-    :return: file content
+    :return: file content, including the trailing newline
     """
     # Month Day Year HH:MM:SS
     date = datetime.datetime.now().strftime("%b %d %Y %H:%M:%S")
 
-    lines = [f"# Generated by {SCRIPT_NAME} on {date}"]
-    if builddeps:
-        lines.extend(builddeps)
-    else:
-        lines.append("# <no build dependencies found>")
-
+    header = [f"# Generated by {SCRIPT_NAME} on {date}"]
+    if not builddeps:
+        builddeps = ["# <no build dependencies found>"]
+    footer = []
     if is_partial:
-        lines.append("# <pip download failed, output may be incomplete!>")
+        footer.append("# <pip download failed, output may be incomplete!>")
 
-    file_content = "\n".join(lines)
+    lines = itertools.chain(header, builddeps, footer)
+    file_content = "".join(f"{line}\n" for line in lines)
     return file_content
 
 
@@ -131,9 +173,8 @@ def _parse_requirements_file(builddeps_file):
     try:
         with open(builddeps_file) as f:
             # ignore line comments or comments added after dependency is declared
-            requirement_re = re.compile(r"^([^\s#;]+)")
-            matches = (requirement_re.match(line) for line in f)
-            return set(match.group(1) for match in matches if match)
+            requirements = (_take_requirement(line, delimiters="#;") for line in f)
+            return set(requirement for requirement in requirements if requirement)
     except FileNotFoundError:
         # it's ok if the file doens't exist.
         return set()
@@ -146,6 +187,9 @@ def _sanity_check_args(ap, args):
 
 def main():
     """Run script."""
+    logging.basicConfig(format="%(levelname)s: %(message)s")
+    log.setLevel(logging.INFO)
+
     ap = argparse.ArgumentParser(description=DESCRIPTION)
     ap.add_argument("requirements_files", metavar="REQUIREMENTS_FILE", nargs="+")
     ap.add_argument(
@@ -194,12 +238,12 @@ def main():
         original_builddeps = _parse_requirements_file(args.output_file)
         if args.append:
             # append only new dependencies
-            builddeps = sorted(set(builddeps) - original_builddeps)
-        if not builddeps or set(builddeps) == original_builddeps:
+            builddeps -= original_builddeps
+        if not builddeps or builddeps == original_builddeps:
             log.info("No new build dependencies found.")
             return
 
-    file_content = generate_file_content(builddeps, is_partial)
+    file_content = generate_file_content(sorted(builddeps), is_partial)
 
     log.info("Make sure to pip-compile the output before submitting a Cachito request")
     if is_partial:
@@ -208,9 +252,9 @@ def main():
     if args.output_file:
         mode = "a" if args.append else "w"
         with open(args.output_file, mode) as f:
-            print(file_content, file=f)
+            f.write(file_content)
     else:
-        print(file_content)
+        sys.stdout.write(file_content)
 
 
 if __name__ == "__main__":
@@ -10,6 +10,20 @@ from cachito.workers.config import get_worker_config
 log = logging.getLogger(__name__)
 
 
+def _ensure_dir(path: pathlib.Path) -> None:
+    """
+    Create a directory and its parents if it does not exist yet.
+
+    The directory usually exists already, in which case a single stat is cheaper than
+    ``mkdir(parents=True, exist_ok=True)``, which attempts the mkdir before checking.
+
+    :param pathlib.Path path: the directory to create.
+    """
+    log.debug("Ensure directory %s exists.", path)
+    if not path.is_dir():
+        path.mkdir(parents=True, exist_ok=True)
+
+
 class RequestBundleDir(paths.RequestBundleDir):
     """
     Represents a concrete request bundle directory used on the worker.
@@ -28,8 +42,7 @@ class RequestBundleDir(paths.RequestBundleDir):
         self = super().__new__(cls, request_id, root_dir)
 
         log.debug("Ensure directory %s exists.", self)
-        log.debug("Ensure directory %s exists.", self.deps_dir)
-        self.deps_dir.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(self.deps_dir)
 
         return self
 
@@ -54,11 +67,9 @@ class SourcesDir(base_path):
         """Create a new Path object."""
         self = super().__new__(cls, get_worker_config().cachito_sources_dir)
 
-        repo_relative_dir = pathlib.Path(*repo_name.split("/"))
-        self.package_dir = self.joinpath(repo_relative_dir)
-        self.archive_path = self.joinpath(repo_relative_dir, f"{ref}.tar.gz")
+        self.package_dir = self.joinpath(*repo_name.split("/"))
+        self.archive_path = self.package_dir.joinpath(f"{ref}.tar.gz")
 
-        log.debug("Ensure directory %s exists.", self.package_dir)
-        self.package_dir.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(self.package_dir)
 
         return self